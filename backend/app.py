@@ -1,15 +1,20 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, ConfigDict
 from typing import Optional, List
-import os, json, uuid
-from datetime import datetime
-from cryptography.fernet import Fernet
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import asyncio
+import base64
+import os
+from functools import partial
+import orjson
 import logging
 
-from cyborg_integration import CyborgDBClient
+from cyborg_integration import CyborgDBClient, api_workers
+from medical_chatbot import MedicalChatbot
+from ids import uuid7
+from tasks import store_encrypted_record_task
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -17,60 +22,165 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="MedGuard AI",
     description="HIPAA-compliant healthcare platform with CyborgDB encryption",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
+# Explicit origins, methods and headers: preflights are answered from fixed lists
+# instead of echoing whatever the browser requested
+CORS_ORIGINS = orjson.loads(os.getenv("CORS_ORIGINS", '["http://localhost:3000", "http://localhost:8000"]'))
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=CORS_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["Content-Type"],
 )
 
 # ====================== REQUEST MODELS ======================
-class AppointmentRequest(BaseModel):
+class RequestModel(BaseModel):
+    model_config = ConfigDict(str_strip_whitespace=True, extra='ignore')
+
+class AppointmentRequest(RequestModel):
     patient_id: str
     doctor_name: str
     appointment_date: str
     reason: str
 
-class LabOrderRequest(BaseModel):
+class LabOrderRequest(RequestModel):
     patient_id: str
     test_types: List[str]
     priority: str = "normal"
 
-class BillingRequest(BaseModel):
+class PrescriptionRequest(RequestModel):
+    patient_id: str
+    medication: str
+    dosage: str
+
+class BillingRequest(RequestModel):
     patient_id: str
     service_date: str
     amount: float
     service_description: str
 
+class ChatRequest(RequestModel):
+    patient_id: str
+    message: str
+
 # ====================== GLOBAL CYBORG CLIENT ======================
 cyborg_client = None
+chatbot = None
+
+# ====================== WRITE BATCHING ======================
+# Non-critical records are queued and flushed through the bulk COPY path
+RECORD_FLUSH_INTERVAL = 0.01
+# A failed bulk write is retried this many times, doubling the delay from
+# RECORD_FLUSH_RETRY_DELAY seconds, before the batch is dropped
+RECORD_FLUSH_RETRIES = 4
+RECORD_FLUSH_RETRY_DELAY = 0.1
+# Queued at shutdown: the flusher writes everything ahead of it, then exits
+RECORD_QUEUE_STOP = object()
+record_queue: Optional[asyncio.Queue] = None
+record_flusher: Optional[asyncio.Task] = None
+
+def enqueue_record(record_type: str, data: dict, patient_id: str) -> str:
+    """Queue a record for the next bulk flush and return its id immediately"""
+    record_id = str(uuid7())
+    record_queue.put_nowait((record_type, data, patient_id, record_id))
+    return record_id
+
+async def store_batch_with_retry(batch: list):
+    """
+    Bulk-store a batch, retrying with exponential backoff; the write is one transaction,
+    so a failed attempt leaves nothing behind. Dropped batches are logged by record id.
+    """
+    delay = RECORD_FLUSH_RETRY_DELAY
+    for attempt in range(RECORD_FLUSH_RETRIES + 1):
+        try:
+            await cyborg_client.store_encrypted_records_bulk(batch)
+            return
+        except Exception as e:
+            if attempt == RECORD_FLUSH_RETRIES:
+                record_ids = [item[3] for item in batch]
+                logger.error(
+                    f"Dropped {len(batch)} queued records after {attempt + 1} attempts: "
+                    f"{str(e)}; record ids: {record_ids}"
+                )
+                return
+            logger.warning(f"Flushing {len(batch)} queued records failed, retrying in {delay}s: {str(e)}")
+            await asyncio.sleep(delay)
+            delay *= 2
+
+async def flush_queued_records(batch: Optional[list] = None) -> bool:
+    """Write everything currently queued in one bulk call; True if the stop marker was drained"""
+    batch = batch or []
+    stopped = False
+    while not record_queue.empty():
+        item = record_queue.get_nowait()
+        if item is RECORD_QUEUE_STOP:
+            stopped = True
+        else:
+            batch.append(item)
+    if batch:
+        await store_batch_with_retry(batch)
+    return stopped
+
+async def record_flush_loop():
+    """Drain the record queue every RECORD_FLUSH_INTERVAL seconds until stopped"""
+    while True:
+        first = await record_queue.get()
+        if first is RECORD_QUEUE_STOP:
+            return
+        await asyncio.sleep(RECORD_FLUSH_INTERVAL)
+        if await flush_queued_records([first]):
+            return
+
+async def dispatch_record_write(record_type: str, data: dict, patient_id: str) -> str:
+    """
+    Encrypt a record here and hand only its ciphertext and patient hash to the Celery
+    worker, so no PHI reaches the broker. The blocking publish runs off the event loop.
+    """
+    record_id = str(uuid7())
+    args = (
+        record_type,
+        base64.b64encode(cyborg_client.encrypt_payload(data, patient_id.encode())).decode(),
+        cyborg_client.patient_hash(patient_id).hex(),
+        record_id
+    )
+    await asyncio.get_running_loop().run_in_executor(
+        None, partial(store_encrypted_record_task.apply_async, args)
+    )
+    return record_id
 
 @app.on_event("startup")
-def startup_event():
-    global cyborg_client
+async def startup_event():
+    global cyborg_client, chatbot, record_queue, record_flusher
     try:
-        cyborg_client = CyborgDBClient(
-            host=os.getenv("DB_HOST", "localhost"),
-            port=int(os.getenv("DB_PORT", "5432")),
-            database=os.getenv("DB_NAME", "medguard_db"),
-            user=os.getenv("DB_USER", "postgres"),
-            password=os.getenv("DB_PASSWORD", "password")
-        )
+        cyborg_client = CyborgDBClient.from_env()
+        await cyborg_client.init_connection()
+        record_queue = asyncio.Queue()
+        record_flusher = asyncio.create_task(record_flush_loop())
         logger.info("CyborgDB client initialized successfully")
     except Exception as e:
         logger.error(f"Failed to initialize CyborgDB client: {str(e)}")
         raise
+    try:
+        chatbot = MedicalChatbot(cyborg_client)
+    except Exception as e:
+        logger.warning(f"Medical chatbot disabled: {str(e)}")
 
 @app.on_event("shutdown")
-def shutdown_event():
+async def shutdown_event():
     global cyborg_client
     if cyborg_client:
         try:
-            cyborg_client.close_connection()
+            if record_flusher:
+                # Let the flusher finish its in-flight batch instead of cancelling it mid-write
+                record_queue.put_nowait(RECORD_QUEUE_STOP)
+                await record_flusher
+            await flush_queued_records()
+            await cyborg_client.close_connection()
             logger.info("CyborgDB connection closed")
         except Exception as e:
             logger.error(f"Error closing connection: {str(e)}")
@@ -86,16 +196,17 @@ async def health_check():
 async def create_appointment(request: AppointmentRequest):
     """Create a new appointment with encrypted storage"""
     try:
-        appointment_id = str(uuid.uuid4())
+        appointment_id = str(uuid7())
         response = f"Appointment {appointment_id} scheduled with Dr. {request.doctor_name}"
         
-        await cyborg_client.store_encrypted_record(
-            record_type="appointment",
-            data={"appointment_id": appointment_id, "doctor_name": request.doctor_name, "date": request.appointment_date, "reason": request.reason},
-            patient_id=request.patient_id
+        # The database write happens in a Celery worker
+        record_id = await dispatch_record_write(
+            "appointment",
+            {"appointment_id": appointment_id, "doctor_name": request.doctor_name, "date": request.appointment_date, "reason": request.reason},
+            request.patient_id
         )
         
-        return {"status": "success", "response": response, "hipaa_compliant": True}
+        return {"status": "success", "response": response, "record_id": record_id, "hipaa_compliant": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -113,16 +224,17 @@ async def get_appointments(patient_id: str):
 async def create_lab_order(request: LabOrderRequest):
     """Create encrypted lab orders"""
     try:
-        lab_id = str(uuid.uuid4())
+        lab_id = str(uuid7())
         response = f"Lab order {lab_id} created for patient {request.patient_id}"
         
-        await cyborg_client.store_encrypted_record(
-            record_type="lab_order",
-            data={"lab_id": lab_id, "test_types": request.test_types, "priority": request.priority},
-            patient_id=request.patient_id
+        # The database write happens in a Celery worker
+        record_id = await dispatch_record_write(
+            "lab_order",
+            {"lab_id": lab_id, "test_types": request.test_types, "priority": request.priority},
+            request.patient_id
         )
         
-        return {"status": "success", "response": response, "hipaa_compliant": True}
+        return {"status": "success", "response": response, "record_id": record_id, "hipaa_compliant": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -137,19 +249,20 @@ async def get_lab_orders(patient_id: str):
 
 # ====================== PRESCRIPTION ENDPOINTS ======================
 @app.post("/api/prescriptions")
-async def create_prescription(request: dict):
+async def create_prescription(request: PrescriptionRequest):
     """Create encrypted prescriptions"""
     try:
-        prescription_id = str(uuid.uuid4())
+        prescription_id = str(uuid7())
         response = f"Prescription {prescription_id} issued"
         
-        await cyborg_client.store_encrypted_record(
-            record_type="prescription",
-            data={"prescription_id": prescription_id, "medication": request.get("medication"), "dosage": request.get("dosage")},
-            patient_id=request["patient_id"]
+        # The database write happens in a Celery worker
+        record_id = await dispatch_record_write(
+            "prescription",
+            {"prescription_id": prescription_id, "medication": request.medication, "dosage": request.dosage},
+            request.patient_id
         )
         
-        return {"status": "success", "response": response, "hipaa_compliant": True}
+        return {"status": "success", "response": response, "record_id": record_id, "hipaa_compliant": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -167,16 +280,17 @@ async def get_prescriptions(patient_id: str):
 async def create_billing_record(request: BillingRequest):
     """Create encrypted billing records"""
     try:
-        billing_id = str(uuid.uuid4())
+        billing_id = str(uuid7())
         response = f"Billing record {billing_id} created"
         
-        await cyborg_client.store_encrypted_record(
-            record_type="billing",
-            data={"billing_id": billing_id, "amount": request.amount, "service_date": request.service_date, "service_description": request.service_description},
-            patient_id=request.patient_id
+        # The database write happens in a Celery worker
+        record_id = await dispatch_record_write(
+            "billing",
+            {"billing_id": billing_id, "amount": request.amount, "service_date": request.service_date, "service_description": request.service_description},
+            request.patient_id
         )
         
-        return {"status": "success", "response": response, "hipaa_compliant": True}
+        return {"status": "success", "response": response, "record_id": record_id, "hipaa_compliant": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -193,35 +307,61 @@ async def get_billing_records(patient_id: str):
 @app.get("/api/records/{patient_id}")
 async def get_unified_records(patient_id: str):
     """Retrieve unified encrypted health records"""
-    """Retrieve unified encrypted health records"""
-    return {
-        "status": "success",
-        "records": {
-            "appointments": [],
-            "labs": [],
-            "prescriptions": [],
-            "billing": []
-        },
-        "encrypted": True
-    }
-
-# ====================== MEDICAL CHAT ENDPOINT ======================
-@app.post("/api/chat")
-async def medical_chat(request: dict):
-    """HIPAA-compliant AI medical chatbot"""
     try:
-        response = f"HIPAA-compliant response to: {request.get('message')}"
-        
-        await cyborg_client.store_encrypted_record(
-            record_type="chat_interaction",
-            data={"message": request.get('message'), "response": response},
-            patient_id=request.get('patient_id')
-        )
-        
-        return {"status": "success", "response": response, "hipaa_compliant": True}
+        records = await cyborg_client.get_unified_records(patient_id)
+        return {"status": "success", "records": records, "encrypted": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# ====================== MEDICAL CHAT ENDPOINT ======================
+@app.post("/api/chat")
+async def medical_chat(request: ChatRequest):
+    """HIPAA-compliant AI medical chatbot, streamed as Server-Sent Events"""
+    if chatbot is None:
+        raise HTTPException(status_code=503, detail="Medical chatbot is not configured")
+    
+    patient_id = request.patient_id
+    message = request.message
+    tokens = []
+    completed = False
+    
+    async def event_stream():
+        nonlocal completed
+        try:
+            async for token in chatbot.stream_patient_query(patient_id, message):
+                tokens.append(token)
+                yield b"data: " + orjson.dumps({'token': token}) + b"\n\n"
+            completed = True
+            yield b"event: done\ndata: {}\n\n"
+        except Exception as e:
+            logger.error(f"Error streaming medical chat: {str(e)}")
+            yield b"event: error\ndata: " + orjson.dumps({'message': 'Unable to process your query. Please try again.'}) + b"\n\n"
+    
+    async def persist_conversation():
+        # Runs after the response is sent; a reply cut short by a stream error is not saved.
+        # Chat transcripts go through the batched bulk path
+        if completed and tokens:
+            enqueue_record(
+                record_type="chat_interaction",
+                data=await chatbot.finish_streamed_query(patient_id, message, "".join(tokens)),
+                patient_id=patient_id
+            )
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        background=BackgroundTask(persist_conversation)
+    )
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Each worker holds its own DB pool: keep API_WORKERS * DB_POOL_MAX_SIZE within
+    # PgBouncer's max_client_conn, and API_WORKERS at or below the available cores
+    uvicorn.run(
+        "app:app",
+        host=os.getenv("API_HOST", "0.0.0.0"),
+        port=int(os.getenv("API_PORT", "8000")),
+        loop="uvloop",
+        http="httptools",
+        workers=api_workers()
+    )
@@ -1,127 +1,424 @@
 import asyncio
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from cryptography.fernet import Fernet
-import json
+import asyncpg
+import redis.asyncio as aioredis
+from cachetools import TTLCache
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+import base64
+import binascii
+import hashlib
+import orjson
+import os
 import logging
+import multiprocessing
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from typing import Dict, List, Optional
 from datetime import datetime
-import uuid
+
+from ids import uuid7
 
 logger = logging.getLogger(__name__)
 
+# AES-GCM nonce length in bytes; the nonce is stored in front of the ciphertext
+NONCE_SIZE = 12
+
+# Patient ids are stored and used in cache keys as a keyed 16-byte BLAKE2b digest
+PATIENT_HASH_SIZE = 16
+PATIENT_HASH_PERSON = b"medguard-pid"
+
+# The master key is never used directly: AES-GCM and the patient hash each get their
+# own subkey, derived as BLAKE2b keyed with the master key under these personalizations
+ENCRYPTION_SUBKEY_PERSON = b"medguard-kdf-enc"
+PATIENT_HASH_SUBKEY_PERSON = b"medguard-kdf-pid"
+
+# Serialized once: every record is stored with the same role-based access map
+DEFAULT_ROLE_ACCESS = orjson.dumps({"doctor": True, "patient": True}).decode()
+
+# Record types returned by get_unified_records, mapped to their response key
+UNIFIED_RECORD_TYPES = {
+    "appointment": "appointments",
+    "lab_order": "labs",
+    "prescription": "prescriptions",
+    "billing": "billing"
+}
+
+# Redis cache entries live under rec:<patient hash>:<version>; a write bumps ver:<patient hash>,
+# so results cached from a read that raced the write land on a key nobody reads again.
+# Version keys outlive the entries built on them by this margin (seconds).
+CACHE_VERSION_TTL_MARGIN = 60
+
+# In-process cache tier: coalesces bursts of identical reads within a worker
+LOCAL_CACHE_SIZE = 1024
+LOCAL_CACHE_TTL = 1
+
+# Uvicorn worker processes when API_WORKERS is unset
+API_WORKERS_DEFAULT = 4
+
+# Result sets larger than this are decrypted in the worker process pool;
+# below it the pickling round trip costs more than decrypting inline
+PARALLEL_DECRYPT_THRESHOLD = 16
+
+# Hot-path statements. With statement_cache_size > 0, asyncpg's per-connection statement
+# cache prepares each once and re-prepares it after schema changes.
+# Record insert and audit entry share one statement: one round trip, one commit.
+HOT_STATEMENTS = {
+    "store": """
+        WITH r AS (
+            INSERT INTO encrypted_records
+            (id, patient_id, record_type, encrypted_data, role_based_access)
+            VALUES ($1, $2, $3, $4, $5)
+            ON CONFLICT (id) DO NOTHING
+            RETURNING id
+        )
+        INSERT INTO audit_trail (patient_id, action, user_role, details)
+        SELECT $2, 'STORE', 'SYSTEM', $6::jsonb FROM r
+    """,
+    "query_type": """
+        SELECT id, record_type, encrypted_data, created_at, role_based_access
+        FROM encrypted_records
+        WHERE patient_id = $1 AND record_type = $2
+        ORDER BY created_at DESC
+        LIMIT $3
+    """,
+    "query_all": """
+        SELECT id, record_type, encrypted_data, created_at, role_based_access
+        FROM encrypted_records
+        WHERE patient_id = $1
+        ORDER BY created_at DESC
+        LIMIT $2
+    """,
+    "query_multi": """
+        SELECT id, record_type, encrypted_data, created_at, role_based_access
+        FROM (
+            SELECT id, record_type, encrypted_data, created_at, role_based_access,
+                   row_number() OVER (PARTITION BY record_type ORDER BY created_at DESC) AS rn
+            FROM encrypted_records
+            WHERE patient_id = $1 AND record_type = ANY($2::text[])
+        ) ranked
+        WHERE rn <= $3
+        ORDER BY created_at DESC
+    """
+}
+
+
+def _load_key(master_key: Optional[str]) -> bytes:
+    """
+    Decode the urlsafe-base64 encoded 256-bit master key.
+    There is no generated fallback: every API and Celery worker process must share
+    one key, or records, patient hashes and cached entries would not be readable across them.
+    """
+    if not master_key:
+        raise ValueError(
+            "CYBORG_DB_KEY is required; generate one with "
+            "python -c \"import os,base64;print(base64.urlsafe_b64encode(os.urandom(32)).decode())\""
+        )
+    try:
+        key_bytes = base64.urlsafe_b64decode(master_key)
+    except (binascii.Error, ValueError):
+        raise ValueError("CYBORG_DB_KEY must be a urlsafe-base64 encoded 32-byte key")
+    if len(key_bytes) != 32:
+        raise ValueError("CYBORG_DB_KEY must decode to exactly 32 bytes")
+    return key_bytes
+
+
+def _cpu_has_aes() -> Optional[bool]:
+    """
+    Whether the CPU advertises AES instructions (AES-NI on x86, the crypto
+    extensions on ARMv8); None when /proc/cpuinfo is not available
+    """
+    try:
+        with open("/proc/cpuinfo") as cpuinfo:
+            for line in cpuinfo:
+                if line.startswith(("flags", "Features")):
+                    return "aes" in line.split(":", 1)[1].split()
+    except OSError:
+        pass
+    return None
+
+
+def _derive_subkey(master_key: bytes, person: bytes) -> bytes:
+    """Derive a 32-byte subkey for one purpose from the master key"""
+    return hashlib.blake2b(key=master_key, digest_size=32, person=person).digest()
+
+
+def api_workers() -> int:
+    """Number of uvicorn worker processes serving the API"""
+    return max(1, int(os.getenv("API_WORKERS", str(API_WORKERS_DEFAULT))))
+
+
+def _default_decrypt_workers() -> int:
+    """
+    Decrypt processes per API worker: the cores are shared by API_WORKERS processes,
+    each with its own pool
+    """
+    return max(1, (os.cpu_count() or 1) // api_workers())
+
+
+# Set once per decrypt worker process by _init_decrypt_worker
+_worker_aead: Optional[AESGCM] = None
+
+
+def _init_decrypt_worker(encryption_key: bytes):
+    """
+    Pool initializer: the key is sent to each worker process once, not with every batch
+    """
+    global _worker_aead
+    _worker_aead = AESGCM(encryption_key)
+
+
+def _batch_decrypt(blobs: List[bytes], associated_data: Optional[bytes]) -> list:
+    """
+    Decrypt a batch of encrypt_payload blobs; runs in a worker process
+    """
+    return [
+        orjson.loads(_worker_aead.decrypt(blob[:NONCE_SIZE], blob[NONCE_SIZE:], associated_data))
+        for blob in blobs
+    ]
+
+
 class CyborgDBClient:
     """
     Integration layer for CyborgDB - handles encrypted vector storage
     for sensitive healthcare data with HIPAA compliance
     """
     
-    def __init__(self, host: str, port: int, db_name: str, master_key: str):
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        db_name: str,
+        master_key: Optional[str] = None,
+        user: str = "postgres",
+        password: str = "postgres",
+        min_pool_size: int = 5,
+        max_pool_size: int = 20,
+        statement_cache_size: int = 0,
+        redis_url: Optional[str] = None,
+        cache_ttl: int = 60,
+        decrypt_workers: Optional[int] = None
+    ):
         self.host = host
         self.port = port
         self.db_name = db_name
-        self.master_key = master_key.encode() if master_key else Fernet.generate_key()
-        self.cipher = Fernet(self.master_key)
-        self.connection_pool = []
-        self.init_connection()
+        self.user = user
+        self.password = password
+        self.min_pool_size = min_pool_size
+        self.max_pool_size = max_pool_size
+        # Must stay 0 behind PgBouncer in transaction mode: server-side prepared
+        # statements do not survive a backend switch between transactions
+        self.statement_cache_size = statement_cache_size
+        key_bytes = _load_key(master_key)
+        self.encryption_key = _derive_subkey(key_bytes, ENCRYPTION_SUBKEY_PERSON)
+        self.patient_hash_key = _derive_subkey(key_bytes, PATIENT_HASH_SUBKEY_PERSON)
+        self.aead = AESGCM(self.encryption_key)
+        self.pool: Optional[asyncpg.Pool] = None
+        self.redis_url = redis_url
+        self.cache_ttl = cache_ttl
+        self.redis: Optional[aioredis.Redis] = None
+        self._local_cache = TTLCache(maxsize=LOCAL_CACHE_SIZE, ttl=LOCAL_CACHE_TTL)
+        # 0 disables the decryption process pool; None gives this process its share of the cores
+        self.decrypt_workers = _default_decrypt_workers() if decrypt_workers is None else decrypt_workers
+        self._decrypt_pool: Optional[ProcessPoolExecutor] = None
+    
+    @classmethod
+    def from_env(cls) -> "CyborgDBClient":
+        """
+        Build a client from the DB_*, CYBORG_DB_KEY and REDIS_* environment variables.
+        The Redis record cache is disabled when REDIS_HOST is unset.
+        """
+        redis_host = os.getenv("REDIS_HOST")
+        redis_url = None
+        if redis_host:
+            redis_url = f"redis://{redis_host}:{os.getenv('REDIS_PORT', '6379')}/{os.getenv('REDIS_DB', '0')}"
+        return cls(
+            host=os.getenv("DB_HOST", "localhost"),
+            port=int(os.getenv("DB_PORT", "6432")),
+            db_name=os.getenv("DB_NAME", "medguard_db"),
+            master_key=os.getenv("CYBORG_DB_KEY"),
+            user=os.getenv("DB_USER", "postgres"),
+            password=os.getenv("DB_PASSWORD", "password"),
+            min_pool_size=int(os.getenv("DB_POOL_MIN_SIZE", "5")),
+            max_pool_size=int(os.getenv("DB_POOL_MAX_SIZE", "20")),
+            statement_cache_size=int(os.getenv("DB_STATEMENT_CACHE_SIZE", "0")),
+            redis_url=redis_url,
+            cache_ttl=int(os.getenv("RECORD_CACHE_TTL", "60")),
+            decrypt_workers=int(os.getenv("DECRYPT_WORKERS", str(_default_decrypt_workers())))
+        )
     
-    def init_connection(self):
-        """Initialize PostgreSQL connection for CyborgDB"""
+    async def init_connection(self):
+        """Initialize the asyncpg connection pool for CyborgDB"""
         try:
-            self.conn = psycopg2.connect(
+            self.pool = await asyncpg.create_pool(
                 host=self.host,
                 port=self.port,
                 database=self.db_name,
-                user="postgres",
-                password="postgres"
+                user=self.user,
+                password=self.password,
+                min_size=self.min_pool_size,
+                max_size=self.max_pool_size,
+                command_timeout=30,
+                statement_cache_size=self.statement_cache_size,
+                max_inactive_connection_lifetime=30,
+                server_settings={"application_name": "medguard"}
             )
             logger.info(f"Connected to CyborgDB at {self.host}:{self.port}")
-            self._create_tables()
+            await self._check_bytea_binary()
+            if _cpu_has_aes() is False:
+                logger.warning("CPU has no AES instructions; AES-GCM will run in software")
+            if self.redis_url:
+                self.redis = aioredis.from_url(self.redis_url)
+                logger.info("Redis record cache enabled")
+            await self._create_tables()
         except Exception as e:
             logger.error(f"Failed to connect to CyborgDB: {str(e)}")
             raise
     
-    def _create_tables(self):
+    async def _check_bytea_binary(self):
+        """
+        Guard that encrypted blobs travel as raw bytes over asyncpg's binary protocol.
+        A text BYTEA codec (hex or escape) would double the bytes on the wire and
+        would hand back a str here instead of the original bytes.
+        """
+        probe = os.urandom(NONCE_SIZE)
+        async with self.pool.acquire() as con:
+            echoed = await con.fetchval("SELECT $1::bytea", probe)
+        if not isinstance(echoed, bytes) or echoed != probe:
+            raise RuntimeError("BYTEA is not using the binary wire format")
+    
+    async def close_connection(self):
+        """Close all pooled connections and the decryption worker pool"""
+        if self._decrypt_pool is not None:
+            self._decrypt_pool.shutdown(wait=False, cancel_futures=True)
+            self._decrypt_pool = None
+        if self.redis is not None:
+            await self.redis.close()
+            self.redis = None
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+    
+    async def _create_tables(self):
         """Create encrypted vector storage tables"""
-        cursor = self.conn.cursor()
         try:
-            # Main encrypted records table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS encrypted_records (
-                    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
-                    patient_id VARCHAR(255) NOT NULL,
-                    record_type VARCHAR(50) NOT NULL,
-                    encrypted_data BYTEA NOT NULL,
-                    data_hash VARCHAR(64),
-                    role_based_access JSONB DEFAULT '{}',
-                    audit_log JSONB DEFAULT '[]',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    INDEX idx_patient_id (patient_id),
-                    INDEX idx_record_type (record_type)
-                )
-            """)
-            
-            # Vector embeddings table for semantic search
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS vector_embeddings (
-                    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
-                    record_id UUID REFERENCES encrypted_records(id),
-                    embedding_vector FLOAT8[],
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
+            async with self.pool.acquire() as con:
+                # Main encrypted records table
+                await con.execute("""
+                    CREATE TABLE IF NOT EXISTS encrypted_records (
+                        id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                        patient_id BYTEA NOT NULL,
+                        record_type VARCHAR(50) NOT NULL,
+                        encrypted_data BYTEA NOT NULL,
+                        data_hash VARCHAR(64),
+                        role_based_access JSONB DEFAULT '{}',
+                        audit_log JSONB DEFAULT '[]',
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                
+                # Indexes matching the patient/type lookups ordered by recency
+                await con.execute("""
+                    CREATE INDEX IF NOT EXISTS ix_er_patient_type_time
+                    ON encrypted_records (patient_id, record_type, created_at DESC)
+                """)
+                await con.execute("""
+                    CREATE INDEX IF NOT EXISTS ix_er_patient_time
+                    ON encrypted_records (patient_id, created_at DESC)
+                """)
+                
+                # Vector embeddings table for semantic search
+                await con.execute("""
+                    CREATE TABLE IF NOT EXISTS vector_embeddings (
+                        id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                        record_id UUID REFERENCES encrypted_records(id),
+                        embedding_vector FLOAT8[],
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                
+                # Audit trail for HIPAA compliance
+                await con.execute("""
+                    CREATE TABLE IF NOT EXISTS audit_trail (
+                        id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                        patient_id BYTEA,
+                        action VARCHAR(100),
+                        user_role VARCHAR(50),
+                        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        details JSONB
+                    )
+                """)
+                await con.execute("""
+                    CREATE INDEX IF NOT EXISTS ix_audit_patient
+                    ON audit_trail (patient_id, timestamp DESC)
+                """)
             
-            # Audit trail for HIPAA compliance
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS audit_trail (
-                    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
-                    patient_id VARCHAR(255),
-                    action VARCHAR(100),
-                    user_role VARCHAR(50),
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    details JSONB
-                )
-            """)
-            
-            self.conn.commit()
             logger.info("CyborgDB tables created successfully")
         except Exception as e:
             logger.error(f"Error creating tables: {str(e)}")
-            self.conn.rollback()
     
-    async def store_encrypted_record(self, record_type: str, data: dict, patient_id: str):
+    def patient_hash(self, patient_id: str) -> bytes:
         """
-        Store encrypted record in CyborgDB
+        Keyed BLAKE2b digest of a patient id, used instead of the raw id in table
+        columns and cache keys. Keyed with a subkey of the master key so ids cannot be
+        recovered by hashing guesses.
+        """
+        return hashlib.blake2b(
+            patient_id.encode(),
+            key=self.patient_hash_key,
+            digest_size=PATIENT_HASH_SIZE,
+            person=PATIENT_HASH_PERSON
+        ).digest()
+    
+    def encrypt_payload(self, data, associated_data: Optional[bytes] = None) -> bytes:
+        """
+        Encrypt a JSON-serializable payload with AES-256-GCM.
+        Returns nonce || ciphertext || tag as raw bytes, ready for BYTEA storage;
+        pass them to asyncpg as-is, never hex-encoded.
+        """
+        nonce = os.urandom(NONCE_SIZE)
+        return nonce + self.aead.encrypt(nonce, orjson.dumps(data), associated_data)
+    
+    def decrypt_payload(self, blob: bytes, associated_data: Optional[bytes] = None):
+        """
+        Authenticate and decrypt a blob produced by encrypt_payload.
+        Slices a memoryview so nonce and ciphertext are not copied out of the row.
+        """
+        view = memoryview(blob)
+        return orjson.loads(self.aead.decrypt(view[:NONCE_SIZE], view[NONCE_SIZE:], associated_data))
+    
+    async def store_encrypted_record(self, record_type: str, data: dict, patient_id: str, record_id: Optional[str] = None):
+        """
+        Store encrypted record in CyborgDB.
+        Storing an already-present record_id is a no-op, so retried writes are safe.
+        """
+        # Encrypt data, bound to the real patient id as associated data
+        return await self.store_sealed_record(
+            record_type,
+            self.encrypt_payload(data, patient_id.encode()),
+            self.patient_hash(patient_id),
+            record_id
+        )
+    
+    async def store_sealed_record(self, record_type: str, encrypted_data: bytes, pid_hash: bytes, record_id: Optional[str] = None):
+        """
+        Store a record that was already encrypted with encrypt_payload, keyed by its patient hash.
+        Lets a background worker write records without ever seeing plaintext or the raw patient id.
         """
         try:
-            # Encrypt data
-            json_data = json.dumps(data).encode()
-            encrypted_data = self.cipher.encrypt(json_data)
+            record_id = record_id or str(uuid7())
             
-            cursor = self.conn.cursor()
-            record_id = str(uuid.uuid4())
-            
-            cursor.execute("""
-                INSERT INTO encrypted_records 
-                (id, patient_id, record_type, encrypted_data, role_based_access)
-                VALUES (%s, %s, %s, %s, %s)
-            """, (
-                record_id,
-                patient_id,
-                record_type,
-                encrypted_data,
-                json.dumps({"doctor": True, "patient": True})
-            ))
-            
-            # Log audit trail
-            self._log_audit(patient_id, "STORE", "SYSTEM", {
-                "record_id": record_id,
-                "record_type": record_type
-            })
+            async with self.pool.acquire() as con:
+                await con.execute(HOT_STATEMENTS["store"],
+                    record_id,
+                    pid_hash,
+                    record_type,
+                    encrypted_data,
+                    DEFAULT_ROLE_ACCESS,
+                    orjson.dumps({"record_id": record_id, "record_type": record_type}).decode()
+                )
             
-            self.conn.commit()
-            logger.info(f"Stored encrypted {record_type} for patient {patient_id}")
+            await self._invalidate_cache(pid_hash)
+            logger.info(f"Stored encrypted {record_type} record {record_id}")
             
             return {
                 "record_id": record_id,
@@ -129,91 +426,235 @@ class CyborgDBClient:
                 "storage": "CyborgDB"
             }
         except Exception as e:
-            self.conn.rollback()
             logger.error(f"Error storing encrypted record: {str(e)}")
             raise
     
+    async def store_encrypted_records_bulk(self, records: List[tuple]) -> List[str]:
+        """
+        Store many encrypted records with one COPY stream per table.
+        Each record is a (record_type, data, patient_id, record_id) tuple;
+        a record_id of None gets a freshly generated id.
+        """
+        try:
+            rows = []
+            audit_rows = []
+            for record_type, data, patient_id, record_id in records:
+                record_id = record_id or str(uuid7())
+                pid_hash = self.patient_hash(patient_id)
+                encrypted_data = self.encrypt_payload(data, patient_id.encode())
+                rows.append((record_id, pid_hash, record_type, encrypted_data, DEFAULT_ROLE_ACCESS))
+                audit_rows.append((pid_hash, "STORE", "SYSTEM", orjson.dumps({
+                    "record_id": record_id,
+                    "record_type": record_type
+                }).decode()))
+            
+            async with self.pool.acquire() as con:
+                async with con.transaction():
+                    await con.copy_records_to_table(
+                        "encrypted_records",
+                        records=rows,
+                        columns=["id", "patient_id", "record_type", "encrypted_data", "role_based_access"]
+                    )
+                    await con.copy_records_to_table(
+                        "audit_trail",
+                        records=audit_rows,
+                        columns=["patient_id", "action", "user_role", "details"]
+                    )
+            
+            for pid_hash in {row[1] for row in rows}:
+                await self._invalidate_cache(pid_hash)
+            
+            logger.info(f"Stored {len(rows)} encrypted records in bulk")
+            return [row[0] for row in rows]
+        except Exception as e:
+            logger.error(f"Error storing encrypted records in bulk: {str(e)}")
+            raise
+    
     async def query_encrypted_records(self, patient_id: str, record_type: Optional[str] = None, limit: int = 10):
         """
-        Query and decrypt records from CyborgDB
+        Query and decrypt records from CyborgDB.
+        Reads go through an in-process TTL cache, then an encrypted Redis cache.
         """
+        pid_hash = self.patient_hash(patient_id)
+        local_key = (pid_hash, record_type, limit)
+        results = self._local_cache.get(local_key)
+        if results is not None:
+            return results
+        
+        field = f"{record_type or '*'}:{limit}"
+        # The version is read before the DB query, so a write landing meanwhile retires it
+        results, version = await self._get_cached_records(pid_hash, field)
+        if results is not None:
+            self._local_cache[local_key] = results
+            return results
+        
         try:
-            cursor = self.conn.cursor(cursor_factory=RealDictCursor)
+            async with self.pool.acquire() as con:
+                if record_type:
+                    rows = await con.fetch(HOT_STATEMENTS["query_type"], pid_hash, record_type, limit)
+                else:
+                    rows = await con.fetch(HOT_STATEMENTS["query_all"], pid_hash, limit)
             
-            if record_type:
-                cursor.execute("""
-                    SELECT * FROM encrypted_records 
-                    WHERE patient_id = %s AND record_type = %s
-                    ORDER BY created_at DESC
-                    LIMIT %s
-                """, (patient_id, record_type, limit))
-            else:
-                cursor.execute("""
-                    SELECT * FROM encrypted_records 
-                    WHERE patient_id = %s
-                    ORDER BY created_at DESC
-                    LIMIT %s
-                """, (patient_id, limit))
+            results = await self._decode_rows(rows, patient_id)
             
-            results = []
-            for row in cursor.fetchall():
-                # Decrypt data
-                decrypted_data = self.cipher.decrypt(row['encrypted_data'])
-                results.append({
-                    "id": str(row['id']),
-                    "record_type": row['record_type'],
-                    "data": json.loads(decrypted_data),
-                    "created_at": row['created_at'].isoformat(),
-                    "role_based_access": row['role_based_access']
-                })
+            logger.info(f"Retrieved {len(results)} encrypted records")
+        except Exception as e:
+            logger.error(f"Error querying records: {str(e)}")
+            raise
+        
+        await self._set_cached_records(pid_hash, version, field, results)
+        self._local_cache[local_key] = results
+        return results
+    
+    async def _get_cached_records(self, pid_hash: bytes, field: str):
+        """
+        Fetch and decrypt a cached query result from Redis.
+        Returns (result or None on a miss, the patient's current cache version).
+        """
+        if self.redis is None:
+            return None, None
+        try:
+            # Reading the version also extends it, so it outlives every entry keyed by it
+            version = await self.redis.getex(
+                f"ver:{pid_hash.hex()}", ex=self.cache_ttl + CACHE_VERSION_TTL_MARGIN
+            )
+            version = int(version or 0)
+            blob = await self.redis.hget(f"rec:{pid_hash.hex()}:{version}", field)
+            if blob is None:
+                return None, version
+            return self.decrypt_payload(blob, pid_hash + field.encode()), version
+        except Exception as e:
+            logger.warning(f"Record cache read failed: {str(e)}")
+            return None, None
+    
+    async def _set_cached_records(self, pid_hash: bytes, version: Optional[int], field: str, results: list):
+        """
+        Cache a query result in Redis under the version read before the query,
+        encrypted since it contains PHI and bound to its patient and query field, so an
+        entry copied to another key fails to decrypt. The TTL is set when the hash is
+        created only.
+        """
+        if self.redis is None or version is None:
+            return
+        try:
+            key = f"rec:{pid_hash.hex()}:{version}"
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.hset(key, field, self.encrypt_payload(results, pid_hash + field.encode()))
+                pipe.expire(key, self.cache_ttl, nx=True)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Record cache write failed: {str(e)}")
+    
+    async def _invalidate_cache(self, pid_hash: bytes):
+        """
+        Retire every cached query result for a patient by bumping its cache version
+        """
+        for local_key in [k for k in self._local_cache if k[0] == pid_hash]:
+            self._local_cache.pop(local_key, None)
+        if self.redis is None:
+            return
+        try:
+            key = f"ver:{pid_hash.hex()}"
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.incr(key)
+                pipe.expire(key, self.cache_ttl + CACHE_VERSION_TTL_MARGIN)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Record cache invalidation failed: {str(e)}")
+    
+    async def query_encrypted_records_multi(self, patient_id: str, record_types: List[str], limit: int = 10):
+        """
+        Query and decrypt several record types in one round trip.
+        Returns up to `limit` most recent records per type, newest first.
+        """
+        try:
+            async with self.pool.acquire() as con:
+                rows = await con.fetch(HOT_STATEMENTS["query_multi"], self.patient_hash(patient_id), record_types, limit)
+            
+            results = await self._decode_rows(rows, patient_id)
             
-            logger.info(f"Retrieved {len(results)} encrypted records for patient {patient_id}")
+            logger.info(f"Retrieved {len(results)} encrypted records")
             return results
         except Exception as e:
             logger.error(f"Error querying records: {str(e)}")
             raise
     
+    async def _decode_rows(self, rows, patient_id: str) -> List[dict]:
+        """
+        Decrypt fetched rows, fanning large result sets out to the worker process pool
+        so CPU-bound decryption does not hold up the event loop
+        """
+        associated_data = patient_id.encode()
+        if len(rows) <= PARALLEL_DECRYPT_THRESHOLD or self.decrypt_workers <= 0:
+            return [self._decode_row(row, associated_data) for row in rows]
+        if self._decrypt_pool is None:
+            # Created on first use; spawned workers avoid forking a threaded process
+            self._decrypt_pool = ProcessPoolExecutor(
+                max_workers=self.decrypt_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_decrypt_worker,
+                initargs=(self.encryption_key,)
+            )
+        payloads = await asyncio.get_running_loop().run_in_executor(
+            self._decrypt_pool,
+            _batch_decrypt,
+            [row['encrypted_data'] for row in rows],
+            associated_data
+        )
+        return [self._decode_row(row, associated_data, data) for row, data in zip(rows, payloads)]
+    
+    def _decode_row(self, row, associated_data: bytes, data=None) -> dict:
+        """
+        Decrypt a fetched encrypted_records row into its API representation.
+        Decryption fails unless the row was stored for the patient in `associated_data`.
+        Pass `data` when the payload has already been decrypted.
+        """
+        return {
+            "id": str(row['id']),
+            "record_type": row['record_type'],
+            "data": self.decrypt_payload(row['encrypted_data'], associated_data) if data is None else data,
+            # A string, not a datetime: results cached in Redis come back through JSON,
+            # so every read path returns the same type
+            "created_at": row['created_at'].isoformat(),
+            "role_based_access": orjson.loads(row['role_based_access'])
+        }
+    
     async def get_unified_records(self, patient_id: str):
         """
         Get all unified records for a patient
         """
         try:
-            appointments = await self.query_encrypted_records(patient_id, "appointment")
-            labs = await self.query_encrypted_records(patient_id, "lab_order")
-            prescriptions = await self.query_encrypted_records(patient_id, "prescription")
-            billing = await self.query_encrypted_records(patient_id, "billing")
+            # One round trip for all four types, grouped client-side
+            records = await self.query_encrypted_records_multi(patient_id, list(UNIFIED_RECORD_TYPES))
+            grouped = defaultdict(list)
+            for record in records:
+                grouped[UNIFIED_RECORD_TYPES[record["record_type"]]].append(record)
             
-            return {
-                "appointments": appointments,
-                "labs": labs,
-                "prescriptions": prescriptions,
-                "billing": billing
-            }
+            return {key: grouped[key] for key in UNIFIED_RECORD_TYPES.values()}
         except Exception as e:
             logger.error(f"Error getting unified records: {str(e)}")
             raise
     
-    def _log_audit(self, patient_id: str, action: str, user_role: str, details: dict):
+    async def _log_audit(self, patient_id: str, action: str, user_role: str, details: dict):
         """
         Log audit trail for HIPAA compliance
         """
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("""
-                INSERT INTO audit_trail (patient_id, action, user_role, details)
-                VALUES (%s, %s, %s, %s)
-            """, (patient_id, action, user_role, json.dumps(details)))
-            self.conn.commit()
+            async with self.pool.acquire() as con:
+                await con.execute("""
+                    INSERT INTO audit_trail (patient_id, action, user_role, details)
+                    VALUES ($1, $2, $3, $4)
+                """, self.patient_hash(patient_id), action, user_role, orjson.dumps(details).decode())
         except Exception as e:
             logger.error(f"Error logging audit: {str(e)}")
     
-    def check_connection(self) -> bool:
+    async def check_connection(self) -> bool:
         """
         Check if database connection is active
         """
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT 1")
+            async with self.pool.acquire() as con:
+                await con.fetchval("SELECT 1")
             return True
         except:
             return False
@@ -0,0 +1,61 @@
+"""Time-ordered UUIDv7 identifiers for MedGuard AI records."""
+
+import os
+import threading
+import time
+import uuid
+
+_RAND_B_MASK = (1 << 62) - 1
+_COUNTER_MASK = 0xFFF
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+_rand_b = 0
+
+
+def _reseed_after_fork():
+    """
+    Forget the parent's state in a forked child (e.g. Celery prefork workers), so the
+    next id draws a fresh random tail instead of repeating the parent's sequence.
+    """
+    global _lock, _last_ms
+    _lock = threading.Lock()
+    _last_ms = 0
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reseed_after_fork)
+
+
+def uuid7() -> uuid.UUID:
+    """
+    Generate a UUIDv7: 48-bit Unix milliseconds, a 12-bit counter and 62 random bits.
+
+    The counter restarts and the random tail is drawn from os.urandom at each new
+    millisecond rather than per call. Ids from one process strictly increase, so B-tree
+    inserts land on the right-most page; more than 4096 ids in a millisecond borrow the
+    next millisecond's timestamp.
+    """
+    global _last_ms, _counter, _rand_b
+    ts_ms = time.time_ns() // 1_000_000
+    with _lock:
+        if ts_ms > _last_ms:
+            _last_ms = ts_ms
+            _counter = 0
+            _rand_b = int.from_bytes(os.urandom(8), "big") & _RAND_B_MASK
+        else:
+            # Same millisecond, or the clock stepped back: keep counting from the last id
+            _counter += 1
+            if _counter > _COUNTER_MASK:
+                _last_ms += 1
+                _counter = 0
+                _rand_b = int.from_bytes(os.urandom(8), "big") & _RAND_B_MASK
+        ts_ms, counter, rand_b = _last_ms, _counter, _rand_b
+    return uuid.UUID(int=(
+        (ts_ms & 0xFFFFFFFFFFFF) << 80
+        | 0x7 << 76
+        | counter << 64
+        | 0b10 << 62
+        | rand_b
+    ))
@@ -1,15 +1,44 @@
 """HIPAA-compliant medical chatbot powered by OpenAI and CyborgDB encryption."""
 
+import asyncio
 import os
 import json
 import logging
-from typing import Optional, List, Dict, Any
+from collections import deque
+from typing import Optional, List, Dict, Any, AsyncIterator
 from datetime import datetime
 import openai
 from cyborg_integration import CyborgDBClient
 
 logger = logging.getLogger(__name__)
 
+# Per-patient chat history kept in Redis: newest messages only, expiring when idle
+HISTORY_MAX_MESSAGES = 20
+HISTORY_TTL_SECONDS = 24 * 60 * 60
+
+# Record types loaded as chat context, mapped to their context key
+CONTEXT_RECORD_TYPES = {
+    "appointment": "appointments",
+    "lab_order": "labs",
+    "prescription": "prescriptions"
+}
+
+SYSTEM_PROMPT_TEMPLATE = """You are a HIPAA-compliant medical assistant for patient consultations.
+Your role is to:
+1. Provide general medical information and guidance
+2. Help patients understand their appointments and prescriptions
+3. Answer questions about lab results and medical procedures
+4. Maintain strict confidentiality and data protection
+5. Always recommend consulting with licensed physicians for critical decisions
+
+Patient Context:
+- Recent Appointments: {appointments}
+- Active Lab Orders: {labs}
+- Current Prescriptions: {prescriptions}
+
+IMPORTANT: All responses must be HIPAA-compliant and avoid exposing sensitive patient information.
+Recommend professional medical consultation for serious health concerns."""
+
 
 class MedicalChatbot:
     """HIPAA-compliant AI medical chatbot for patient consultations."""
@@ -19,27 +48,16 @@ class MedicalChatbot:
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
         self.model = os.getenv("LLM_MODEL", "gpt-4")
         self.temperature = float(os.getenv("LLM_TEMPERATURE", "0.7"))
-        openai.api_key = self.openai_api_key
-        self.conversation_history = []
+        self.client = openai.AsyncOpenAI(api_key=self.openai_api_key)
         self.max_history_tokens = 4000
         
     async def process_patient_query(self, patient_id: str, query: str) -> Dict[str, Any]:
         """Process a patient's medical query with HIPAA compliance."""
         try:
-            logger.info(f"Processing medical query for patient: {patient_id}")
-            
-            # Validate patient context
-            context = await self._get_patient_context(patient_id)
-            
-            # Build encrypted system prompt
-            system_prompt = self._build_system_prompt(context)
+            logger.info("Processing medical query")
             
-            # Prepare messages with conversation history
-            messages = [
-                {"role": "system", "content": system_prompt},
-                *self.conversation_history,
-                {"role": "user", "content": query}
-            ]
+            # Validate patient context and build messages with conversation history
+            messages = await self._build_messages(patient_id, query)
             
             # Get response from OpenAI
             response = await self._get_openai_response(messages)
@@ -47,12 +65,7 @@ class MedicalChatbot:
             # Encrypt and store conversation
             await self._store_encrypted_conversation(patient_id, query, response)
             
-            # Update conversation history
-            self.conversation_history.append({"role": "user", "content": query})
-            self.conversation_history.append({"role": "assistant", "content": response})
-            
-            # Maintain token limit
-            self._trim_conversation_history()
+            await self._remember_exchange(patient_id, query, response)
             
             return {
                 "status": "success",
@@ -71,46 +84,57 @@ class MedicalChatbot:
                 "hipaa_compliant": True
             }
     
+    async def stream_patient_query(self, patient_id: str, query: str) -> AsyncIterator[str]:
+        """Stream the response to a patient's query as it is generated."""
+        logger.info("Streaming medical query")
+        messages = await self._build_messages(patient_id, query)
+        async for token in self._stream_openai_response(messages):
+            yield token
+    
+    async def finish_streamed_query(self, patient_id: str, query: str, response: str) -> Dict[str, Any]:
+        """Record a completed streamed exchange and return its encrypted-storage payload."""
+        await self._remember_exchange(patient_id, query, response)
+        return self._conversation_record(query, response)
+    
+    async def _build_messages(self, patient_id: str, query: str) -> List[Dict[str, str]]:
+        """Build the system prompt, conversation history and query for the LLM."""
+        context, history = await asyncio.gather(
+            self._get_patient_context(patient_id),
+            self._load_history(patient_id)
+        )
+        
+        # Build encrypted system prompt
+        system_prompt = self._build_system_prompt(context)
+        
+        return [
+            {"role": "system", "content": system_prompt},
+            *history,
+            {"role": "user", "content": query}
+        ]
+    
     async def _get_patient_context(self, patient_id: str) -> Dict[str, Any]:
         """Retrieve encrypted patient context for conversation."""
-        # Retrieve patient appointments, labs, and prescriptions
-        appointments = await self.cyborg_client.query_encrypted_records(
-            patient_id, "appointment"
-        )
-        labs = await self.cyborg_client.query_encrypted_records(
-            patient_id, "lab_order"
-        )
-        prescriptions = await self.cyborg_client.query_encrypted_records(
-            patient_id, "prescription"
+        # Retrieve patient appointments, labs, and prescriptions in one query
+        records = await self.cyborg_client.query_encrypted_records_multi(
+            patient_id, list(CONTEXT_RECORD_TYPES)
         )
         
-        return {
-            "appointments": appointments,
-            "labs": labs,
-            "prescriptions": prescriptions
-        }
+        context = {key: [] for key in CONTEXT_RECORD_TYPES.values()}
+        for record in records:
+            context[CONTEXT_RECORD_TYPES[record["record_type"]]].append(record)
+        return context
     
     def _build_system_prompt(self, context: Dict[str, Any]) -> str:
         """Build HIPAA-compliant system prompt with patient context."""
-        return f"""You are a HIPAA-compliant medical assistant for patient consultations.
-Your role is to:
-1. Provide general medical information and guidance
-2. Help patients understand their appointments and prescriptions
-3. Answer questions about lab results and medical procedures
-4. Maintain strict confidentiality and data protection
-5. Always recommend consulting with licensed physicians for critical decisions
-
-Patient Context:
-- Recent Appointments: {len(context.get('appointments', []))}
-- Active Lab Orders: {len(context.get('labs', []))}
-- Current Prescriptions: {len(context.get('prescriptions', []))}
-
-IMPORTANT: All responses must be HIPAA-compliant and avoid exposing sensitive patient information.
-Recommend professional medical consultation for serious health concerns."""
+        return SYSTEM_PROMPT_TEMPLATE.format(
+            appointments=len(context.get('appointments', [])),
+            labs=len(context.get('labs', [])),
+            prescriptions=len(context.get('prescriptions', []))
+        )
     
     async def _get_openai_response(self, messages: List[Dict[str, str]]) -> str:
-        """Get response from OpenAI with streaming support."""
-        response = openai.ChatCompletion.create(
+        """Get response from OpenAI without blocking the event loop."""
+        response = await self.client.chat.completions.create(
             model=self.model,
             messages=messages,
             temperature=self.temperature,
@@ -119,35 +143,95 @@ Recommend professional medical consultation for serious health concerns."""
             frequency_penalty=0.0,
             presence_penalty=0.0
         )
-        return response["choices"][0]["message"]["content"]
+        return response.choices[0].message.content
     
-    async def _store_encrypted_conversation(self, patient_id: str, query: str, response: str):
-        """Store encrypted conversation in CyborgDB."""
-        conversation_data = {
+    async def _stream_openai_response(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        """Yield response tokens from OpenAI as they arrive."""
+        stream = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=self.temperature,
+            max_tokens=1000,
+            top_p=0.95,
+            stream=True
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    
+    def _conversation_record(self, query: str, response: str) -> Dict[str, Any]:
+        """Build the conversation payload stored encrypted in CyborgDB."""
+        return {
             "query": query,
             "response": response,
             "timestamp": datetime.utcnow().isoformat(),
             "model": self.model
         }
-        
+    
+    async def _store_encrypted_conversation(self, patient_id: str, query: str, response: str):
+        """Store encrypted conversation in CyborgDB."""
         await self.cyborg_client.store_encrypted_record(
             record_type="chat_interaction",
-            data=conversation_data,
+            data=self._conversation_record(query, response),
             patient_id=patient_id
         )
         
-        logger.info(f"Encrypted conversation stored for patient: {patient_id}")
+        logger.info("Encrypted conversation stored")
+    
+    @staticmethod
+    def _history_key(pid_hash: bytes) -> str:
+        """Redis key of a patient's chat history, built from the hashed patient id."""
+        return f"chat:{pid_hash.hex()}"
     
-    def _trim_conversation_history(self):
-        """Trim conversation history to maintain token limit."""
-        # Simple token estimation: ~4 tokens per word
-        while len(self.conversation_history) > 2:
-            total_tokens = sum(len(msg["content"].split()) * 4 
-                             for msg in self.conversation_history)
-            if total_tokens > self.max_history_tokens:
-                self.conversation_history.pop(0)
-            else:
-                break
+    async def _load_history(self, patient_id: str) -> List[Dict[str, str]]:
+        """Load the patient's conversation history from Redis within the token limit."""
+        redis = self.cyborg_client.redis
+        if redis is None:
+            return []
+        pid_hash = self.cyborg_client.patient_hash(patient_id)
+        try:
+            blobs = await redis.lrange(self._history_key(pid_hash), 0, -1)
+        except Exception as e:
+            logger.warning(f"Chat history read failed: {str(e)}")
+            return []
+        
+        # Entries that fail to decrypt (key change, or moved from another patient's list)
+        # are skipped rather than failing the chat
+        history = deque()
+        for blob in blobs:
+            try:
+                history.append(self.cyborg_client.decrypt_payload(blob, pid_hash))
+            except Exception:
+                logger.warning("Skipped an unreadable chat history entry")
+        total_tokens = sum(entry["tokens"] for entry in history)
+        while total_tokens > self.max_history_tokens and len(history) > 2:
+            total_tokens -= history.popleft()["tokens"]
+        return [{"role": entry["role"], "content": entry["content"]} for entry in history]
+    
+    async def _remember_exchange(self, patient_id: str, query: str, response: str):
+        """Append an exchange to the patient's encrypted Redis history."""
+        redis = self.cyborg_client.redis
+        if redis is None:
+            return
+        pid_hash = self.cyborg_client.patient_hash(patient_id)
+        # Character-based estimate (~4 chars per token) avoids re-splitting history.
+        # The patient hash is bound as associated data, so entries only decrypt in their own list
+        entries = [
+            self.cyborg_client.encrypt_payload(
+                {"role": role, "content": content, "tokens": len(content) // 4 + 1},
+                pid_hash
+            )
+            for role, content in (("user", query), ("assistant", response))
+        ]
+        key = self._history_key(pid_hash)
+        try:
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.rpush(key, *entries)
+                pipe.ltrim(key, -HISTORY_MAX_MESSAGES, -1)
+                pipe.expire(key, HISTORY_TTL_SECONDS)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Chat history write failed: {str(e)}")
     
     async def generate_discharge_summary(self, patient_id: str, visit_details: str) -> str:
         """Generate encrypted AI discharge summary."""
@@ -158,14 +242,14 @@ Recommend professional medical consultation for serious health concerns."""
 Include: diagnosis, treatment, medications, follow-up recommendations.
 Maintain HIPAA compliance and clinical accuracy."""
             
-            response = openai.ChatCompletion.create(
+            response = await self.client.chat.completions.create(
                 model=self.model,
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.5,
                 max_tokens=1500
             )
             
-            summary = response["choices"][0]["message"]["content"]
+            summary = response.choices[0].message.content
             
             # Store encrypted summary
             await self.cyborg_client.store_encrypted_record(
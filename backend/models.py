@@ -1,18 +1,138 @@
 """Database models for MedGuard AI healthcare platform."""
 
-from datetime import datetime
-from enum import Enum
-from typing import Optional, List, Dict, Any
+import time
+from datetime import datetime, timedelta, timezone
+from enum import Enum, IntEnum
+from typing import Any, Callable, ClassVar, Dict, List, Optional, Tuple, Union, cast
 
+import orjson
+from pydantic import BaseModel, ConfigDict, Field
+
+# Timestamps are held as integer nanoseconds since the Unix epoch (UTC)
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _to_ns(timestamp: Union[datetime, int, None]) -> int:
+    """
+    Epoch nanoseconds for a timestamp; naive datetimes are taken as UTC,
+    ints are assumed to already be epoch nanoseconds, None means now.
+    Aware datetimes are converted to UTC; their offset is not kept.
+    """
+    if timestamp is None:
+        return time.time_ns()
+    if isinstance(timestamp, int):
+        return timestamp
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return (timestamp - _EPOCH) // _MICROSECOND * 1000
+
+
+def _from_ns(ts_ns: int) -> datetime:
+    """Naive UTC datetime for epoch nanoseconds (microsecond precision)."""
+    return _EPOCH + timedelta(microseconds=ts_ns // 1000)
+
+
+def _iso_from_ns(ts_ns: int) -> str:
+    """
+    ISO-8601 string for epoch nanoseconds, without building a datetime.
+    Matches naive UTC datetime.isoformat(): the fraction is omitted when it is zero.
+    """
+    secs, rem = divmod(ts_ns, 1_000_000_000)
+    micros = rem // 1000
+    t = time.gmtime(secs)
+    iso = (
+        f"{t.tm_year:04d}-{t.tm_mon:02d}-{t.tm_mday:02d}"
+        f"T{t.tm_hour:02d}:{t.tm_min:02d}:{t.tm_sec:02d}"
+    )
+    return f"{iso}.{micros:06d}" if micros else iso
+
+
+class RecordType(IntEnum):
+    """
+    Types of healthcare records that can be encrypted and stored.
+    Values are dense indexes into the per-type tables below; the wire name is rt.wire.
+    RecordType("billing") still resolves wire names, but a bare member serializes
+    to JSON as its integer: orjson encodes enums natively, so emit rt.wire instead.
+    """
+    APPOINTMENT = 0
+    LAB_ORDER = 1
+    PRESCRIPTION = 2
+    BILLING = 3
+    CHAT_INTERACTION = 4
+    PATIENT_INFO = 5
+
+    @property
+    def wire(self) -> str:
+        """JSON / database name of the record type."""
+        return _RT_WIRE[self]
+
+    @classmethod
+    def _missing_(cls, value: object) -> Optional["RecordType"]:
+        return _RT_BY_WIRE.get(value) if isinstance(value, str) else None
+
+# Wire (JSON / database) name of each record type, indexed by RecordType
+_RT_WIRE = ("appointment", "lab_order", "prescription", "billing", "chat_interaction", "patient_info")
+_RT_BY_WIRE = {wire: RecordType(i) for i, wire in enumerate(_RT_WIRE)}
+
+# EncryptedRecord JSON with the record type baked in; the other fields are filled per record
+_JSON_TMPL = tuple(
+    b'{"record_id":%b,"patient_id":%b,"record_type":"' + wire.encode() +
+    b'","data":%b,"encrypted_data":%b,"encryption_key_id":%b,"timestamp":"%b","is_encrypted":true}'
+    for wire in _RT_WIRE
+)
+
+
+def _record_type(value: Union[RecordType, str]) -> RecordType:
+    """RecordType for a member or its wire name."""
+    if isinstance(value, RecordType):
+        return value
+    try:
+        return _RT_BY_WIRE[value]
+    except KeyError:
+        raise ValueError(f"{value!r} is not a valid RecordType") from None
+
+
+def _gen_to_dict(fields: tuple, doc: str) -> Callable[[Any], Dict[str, Any]]:
+    """
+    Build a straight-line to_dict from field specs. A spec is an attribute name,
+    or a (key, expression) pair when the value is computed from `self`.
+    """
+    items = []
+    for field in fields:
+        key, expr = field if isinstance(field, tuple) else (field, f"self.{field}")
+        items.append(f"{key!r}: {expr}")
+    src = f"def to_dict(self):\n    return {{{', '.join(items)}}}\n"
+    namespace: Dict[str, Any] = {}
+    exec(compile(src, "<models.to_dict>", "exec"), globals(), namespace)
+    to_dict = namespace["to_dict"]
+    to_dict.__doc__ = doc
+    to_dict.__annotations__ = {"return": Dict[str, Any]}
+    return to_dict
+
+
+class Serializable:
+    """
+    Base for the models: each subclass declares _FIELDS (specs as for _gen_to_dict)
+    and gets a generated to_dict when the class is created.
+    Methods are assigned at runtime, so these classes cannot be mypyc native classes.
+    """
+    
+    __slots__ = ()
+    
+    _FIELDS: ClassVar[tuple] = ()
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        if "_FIELDS" in cls.__dict__:
+            cls.to_dict = _gen_to_dict(cls._FIELDS, f"Convert {cls.__name__} to dictionary representation.")
+
+    to_dict = _gen_to_dict(_FIELDS, "Convert to dictionary representation; empty without _FIELDS.")
+
+    def to_json(self) -> bytes:
+        """Serialize to JSON bytes with orjson."""
+        return orjson.dumps(self.to_dict())
 
-class RecordType(str, Enum):
-    """Types of healthcare records that can be encrypted and stored."""
-    APPOINTMENT = "appointment"
-    LAB_ORDER = "lab_order"
-    PRESCRIPTION = "prescription"
-    BILLING = "billing"
-    CHAT_INTERACTION = "chat_interaction"
-    PATIENT_INFO = "patient_info"
 
 class AuditLogType(str, Enum):
     """Types of audit log actions for HIPAA compliance tracking."""
@@ -33,76 +153,230 @@ class AuditLogType(str, Enum):
     
 
 
-class EncryptedRecord:
+class _Unset(Enum):
+    """Marks a lazily parsed attribute that has not been computed yet."""
+    UNSET = 0
+
+
+_UNSET = _Unset.UNSET
+
+
+class EncryptedRecord(Serializable):
     """Represents an encrypted healthcare record in CyborgDB."""
     
+    __slots__ = (
+        "record_id", "patient_id", "record_type", "_data", "_data_raw", "encrypted_data",
+        "encryption_key_id", "_ts_ns", "_ts_iso", "_dict"
+    )
+    
+    # Every EncryptedRecord is encrypted; kept on the class, not per instance
+    is_encrypted: ClassVar[bool] = True
+    
     def __init__(
         self,
         patient_id: str,
-        record_type: RecordType,
-        data: Dict[str, Any],
+        record_type: Union[RecordType, str],
+        data: Union[Dict[str, Any], bytes, str],
         encrypted_data: str,
         encryption_key_id: str,
-        timestamp: datetime = None,
+        timestamp: Union[datetime, int, None] = None,
         record_id: Optional[str] = None
-    ):
+    ) -> None:
         self.record_id = record_id
         self.patient_id = patient_id
-        self.record_type = record_type
-        self.data = data
+        self.record_type = _record_type(record_type)
+        # Payloads given as JSON stay unparsed until .data is read. They are trusted, not
+        # validated: pass only compact orjson output, such as a payload decrypted from storage
+        # (authenticated by AES-GCM), since to_json() embeds it verbatim
+        if isinstance(data, (bytes, str)):
+            self._data: Union[Dict[str, Any], _Unset] = _UNSET
+            self._data_raw: Optional[bytes] = data.encode() if isinstance(data, str) else data
+        else:
+            self._data = data
+            self._data_raw = None
         self.encrypted_data = encrypted_data
         self.encryption_key_id = encryption_key_id
-        self.timestamp = timestamp or datetime.utcnow()
-        self.is_encrypted = True
-
-    def to_dict(self) -> Dict[str, Any]:
-        """Convert record to dictionary representation."""
-        return {
-            "record_id": self.record_id,
-            "patient_id": self.patient_id,
-            "record_type": self.record_type.value,
-            "data": self.data,
-            "encrypted_data": self.encrypted_data,
-            "encryption_key_id": self.encryption_key_id,
-            "timestamp": self.timestamp.isoformat(),
-            "is_encrypted": self.is_encrypted
-        }
-
-
-class AuditLog:
+        self._ts_ns = _to_ns(timestamp)
+        self._ts_iso: Optional[str] = None
+        self._dict: Optional[Dict[str, Any]] = None
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        """Plaintext payload, parsed from raw JSON on first access."""
+        data = self._data
+        if data is _UNSET:
+            # Only raw payloads start unset, so _data_raw holds their JSON
+            data = self._data = orjson.loads(cast(bytes, self._data_raw))
+        return data
+
+    @property
+    def data_json(self) -> bytes:
+        """
+        Payload as JSON bytes, without a parse/serialize round trip when still raw.
+        Raw payloads are returned as given; malformed input is not detected here.
+        """
+        return self._data_raw if self._data_raw is not None else orjson.dumps(self._data)
+
+    @property
+    def timestamp(self) -> datetime:
+        return _from_ns(self._ts_ns)
+
+    @property
+    def timestamp_iso(self) -> str:
+        """ISO-8601 timestamp, formatted on first use."""
+        if self._ts_iso is None:
+            self._ts_iso = _iso_from_ns(self._ts_ns)
+        return self._ts_iso
+
+    _FIELDS = (
+        "record_id", "patient_id", ("record_type", "_RT_WIRE[self.record_type]"), "data",
+        "encrypted_data", "encryption_key_id", ("timestamp", "self.timestamp_iso"),
+        ("is_encrypted", "True")
+    )
+
+    @property
+    def as_dict(self) -> Dict[str, Any]:
+        """Dictionary representation, built on first access and reused; do not mutate."""
+        if self._dict is None:
+            self._dict = self.to_dict()
+        return self._dict
+
+    def to_json(self) -> bytes:
+        """
+        Serialize record to JSON bytes by filling its record type's template.
+        Identical to orjson.dumps(self.to_dict()) as long as a raw payload is compact orjson output.
+        """
+        return _JSON_TMPL[self.record_type] % (
+            orjson.dumps(self.record_id),
+            orjson.dumps(self.patient_id),
+            self.data_json,
+            orjson.dumps(self.encrypted_data),
+            orjson.dumps(self.encryption_key_id),
+            self.timestamp_iso.encode()
+        )
+
+
+# Cleared AuditLog details dicts kept for reuse by AuditLog.create
+DETAILS_POOL_SIZE = 256
+_DETAILS_POOL: List[Dict[str, Any]] = []
+
+
+class AuditLog(Serializable):
     """Represents an audit log entry for HIPAA compliance."""
     
+    __slots__ = ("patient_id", "action", "user_role", "details", "_ts_ns", "status", "_ts_iso", "_dict", "_pooled")
+    
     def __init__(
         self,
         patient_id: str,
         action: str,
         user_role: str,
         details: Dict[str, Any],
-        timestamp: datetime = None,
+        timestamp: Union[datetime, int, None] = None,
         status: str = "success"
-    ):
+    ) -> None:
         self.patient_id = patient_id
         self.action = action
         self.user_role = user_role
         self.details = details
-        self.timestamp = timestamp or datetime.utcnow()
+        self._ts_ns = _to_ns(timestamp)
         self.status = status
+        self._ts_iso: Optional[str] = None
+        self._dict: Optional[Dict[str, Any]] = None
+        # Only details taken from the free-list by create() are returned to it
+        self._pooled = False
+
+    @classmethod
+    def create(
+        cls,
+        patient_id: str,
+        action: str,
+        user_role: str,
+        status: str = "success",
+        **details: Any
+    ) -> "AuditLog":
+        """
+        Build an entry whose details dict is taken from the free-list.
+        Call release() once the entry has been serialized.
+        """
+        try:
+            pooled = _DETAILS_POOL.pop()
+        except IndexError:
+            pooled = {}
+        pooled.update(details)
+        entry = cls(patient_id, action, user_role, pooled, status=status)
+        entry._pooled = True
+        return entry
+
+    def release(self) -> None:
+        """
+        Clear details and return it to the free-list if it came from create();
+        a no-op for entries built with their own details dict. Do not use the entry
+        afterwards: as_dict and any to_dict() result taken before release share the
+        cleared details dict and are invalid too.
+        """
+        if not self._pooled:
+            return
+        details = self.details
+        self.details = {}
+        self._dict = None
+        self._pooled = False
+        details.clear()
+        if len(_DETAILS_POOL) < DETAILS_POOL_SIZE:
+            _DETAILS_POOL.append(details)
+
+    @property
+    def timestamp(self) -> datetime:
+        return _from_ns(self._ts_ns)
+
+    @property
+    def timestamp_iso(self) -> str:
+        """ISO-8601 timestamp, formatted on first use."""
+        if self._ts_iso is None:
+            self._ts_iso = _iso_from_ns(self._ts_ns)
+        return self._ts_iso
+
+    _FIELDS = ("patient_id", "action", "user_role", "details", ("timestamp", "self.timestamp_iso"), "status")
+
+    def freeze(self) -> "AuditLog":
+        """
+        Mark the entry as final so as_dict is built once and reused.
+        details must not be changed after freezing.
+        """
+        self._dict = self.to_dict()
+        return self
+
+    @property
+    def as_dict(self) -> Dict[str, Any]:
+        """Cached dictionary representation once frozen, a fresh one before that."""
+        return self._dict if self._dict is not None else self.to_dict()
+
+    def to_json(self) -> bytes:
+        """Serialize audit log to JSON bytes with orjson."""
+        return orjson.dumps(self.as_dict)
+
+
+class PatientPayload(BaseModel):
+    """Validated patient input; field constraints are enforced by pydantic-core."""
+    model_config = ConfigDict(frozen=True, str_strip_whitespace=True, extra='ignore')
 
-    def to_dict(self) -> Dict[str, Any]:
-        """Convert audit log to dictionary representation."""
-        return {
-            "patient_id": self.patient_id,
-            "action": self.action,
-            "user_role": self.user_role,
-            "details": self.details,
-            "timestamp": self.timestamp.isoformat(),
-            "status": self.status
-        }
+    patient_id: str = Field(min_length=1, max_length=255)
+    name: str = Field(min_length=1)
+    date_of_birth: str = Field(pattern=r"^\d{4}-\d{2}-\d{2}$")
+    ssn_encrypted: str
+    email: str = Field(pattern=r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+    phone: str = Field(pattern=r"^\+?\d{7,15}$")
+    address: str
 
 
-class Patient:
+class Patient(Serializable):
     """Represents a patient in the MedGuard system."""
     
+    __slots__ = (
+        "patient_id", "name", "date_of_birth", "ssn_encrypted", "email",
+        "phone", "address", "_created_ns", "_created_iso"
+    )
+    
     def __init__(
         self,
         patient_id: str,
@@ -112,7 +386,7 @@ class Patient:
         email: str,
         phone: str,
         address: str
-    ):
+    ) -> None:
         self.patient_id = patient_id
         self.name = name
         self.date_of_birth = date_of_birth
@@ -120,17 +394,123 @@ class Patient:
         self.email = email
         self.phone = phone
         self.address = address
-        self.created_at = datetime.utcnow()
-
-    def to_dict(self) -> Dict[str, Any]:
-        """Convert patient to dictionary representation."""
-        return {
-            "patient_id": self.patient_id,
-            "name": self.name,
-            "date_of_birth": self.date_of_birth,
-            "ssn_encrypted": self.ssn_encrypted,
-            "email": self.email,
-            "phone": self.phone,
-            "address": self.address,
-            "created_at": self.created_at.isoformat()
-        }
+        self._created_ns = time.time_ns()
+        self._created_iso: Optional[str] = None
+
+    @classmethod
+    def from_payload(cls, payload: Dict[str, Any]) -> "Patient":
+        """
+        Validate raw input with PatientPayload and build a Patient from it.
+        Raises pydantic.ValidationError on malformed fields.
+        """
+        fields = PatientPayload.model_validate(payload)
+        return cls(
+            fields.patient_id,
+            fields.name,
+            fields.date_of_birth,
+            fields.ssn_encrypted,
+            fields.email,
+            fields.phone,
+            fields.address
+        )
+
+    @property
+    def created_at(self) -> datetime:
+        return _from_ns(self._created_ns)
+
+    @property
+    def created_at_iso(self) -> str:
+        """ISO-8601 creation time, formatted on first use."""
+        if self._created_iso is None:
+            self._created_iso = _iso_from_ns(self._created_ns)
+        return self._created_iso
+
+    _FIELDS = (
+        "patient_id", "name", "date_of_birth", "ssn_encrypted", "email",
+        "phone", "address", ("created_at", "self.created_at_iso")
+    )
+
+
+class RecordStore:
+    """
+    Column-oriented buffer of encrypted records, one set of columns per RecordType.
+    Payloads are kept as JSON bytes; EncryptedRecord objects are only built on read.
+    """
+    
+    COLUMNS = ("record_id", "patient_id", "data", "encrypted_data", "encryption_key_id", "timestamp_ns")
+    
+    __slots__ = ("_columns",)
+    
+    def __init__(self) -> None:
+        self._columns: List[Optional[Dict[str, List[Any]]]] = [None] * len(RecordType)
+
+    def append(self, record: EncryptedRecord) -> int:
+        """Add a record to its type's columns; returns its row index."""
+        columns = self._columns[record.record_type]
+        if columns is None:
+            columns = self._columns[record.record_type] = {name: [] for name in self.COLUMNS}
+        columns["record_id"].append(record.record_id)
+        columns["patient_id"].append(record.patient_id)
+        columns["data"].append(record.data_json)
+        columns["encrypted_data"].append(record.encrypted_data)
+        columns["encryption_key_id"].append(record.encryption_key_id)
+        columns["timestamp_ns"].append(record._ts_ns)
+        return len(columns["record_id"]) - 1
+
+    def __len__(self) -> int:
+        return sum(len(columns["record_id"]) for columns in self._columns if columns is not None)
+
+    def row_count(self, record_type: RecordType) -> int:
+        """Number of stored rows of a record type."""
+        columns = self._columns[record_type]
+        return len(columns["record_id"]) if columns is not None else 0
+
+    def column(self, record_type: RecordType, name: str) -> Tuple[Any, ...]:
+        """
+        Snapshot of one column for a record type, e.g. for filtering without building
+        records. A tuple copy, so callers cannot desynchronize the stored columns.
+        """
+        if name not in self.COLUMNS:
+            raise KeyError(name)
+        columns = self._columns[record_type]
+        return tuple(columns[name]) if columns is not None else ()
+
+    def get(self, record_type: RecordType, index: int) -> EncryptedRecord:
+        """Materialize a single row as an EncryptedRecord; IndexError if there is no such row."""
+        columns = self._columns[record_type]
+        if columns is None:
+            raise IndexError(f"no {_RT_WIRE[record_type]} records stored")
+        return EncryptedRecord(
+            columns["patient_id"][index],
+            record_type,
+            columns["data"][index],
+            columns["encrypted_data"][index],
+            columns["encryption_key_id"][index],
+            columns["timestamp_ns"][index],
+            columns["record_id"][index]
+        )
+
+    def list_records(self, record_type: RecordType) -> List[EncryptedRecord]:
+        """Materialize every stored row of a record type."""
+        return [self.get(record_type, i) for i in range(self.row_count(record_type))]
+
+
+def _default(obj: Any) -> Any:
+    """orjson fallback for model instances nested in a payload."""
+    if isinstance(obj, EncryptedRecord):
+        # Embeds the template-built JSON, so a raw payload is never parsed
+        return orjson.Fragment(obj.to_json())
+    if isinstance(obj, AuditLog):
+        return obj.as_dict
+    if isinstance(obj, Serializable):
+        return obj.to_dict()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps_models(models: List[Any]) -> bytes:
+    """
+    Serialize a list of models (or any payload containing them) in one orjson call,
+    instead of encoding each record separately and joining the results.
+    Bare RecordType members in the payload come out as integers; use rt.wire for the name.
+    """
+    return orjson.dumps(models, default=_default)
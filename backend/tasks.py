@@ -0,0 +1,58 @@
+"""Celery tasks that move record storage off the API request path."""
+
+import asyncio
+import base64
+import logging
+import os
+
+from celery import Celery
+
+from cyborg_integration import CyborgDBClient
+
+logger = logging.getLogger(__name__)
+
+celery_app = Celery(
+    "medguard",
+    broker=os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/1")
+)
+celery_app.conf.update(
+    task_serializer="json",
+    accept_content=["json"],
+    # Acknowledge only after the write so a crashed worker does not lose the record
+    task_acks_late=True,
+    worker_prefetch_multiplier=4
+)
+
+# One event loop and connection pool per worker process, created on first use
+_loop = None
+_client = None
+
+
+def _get_client():
+    """Return the worker's CyborgDB client, connecting on first use"""
+    global _loop, _client
+    if _client is None:
+        _loop = asyncio.new_event_loop()
+        client = CyborgDBClient.from_env()
+        _loop.run_until_complete(client.init_connection())
+        _client = client
+    return _client
+
+
+@celery_app.task(autoretry_for=(Exception,), retry_backoff=True, max_retries=5)
+def store_encrypted_record_task(record_type: str, encrypted_data: str, patient_hash: str, record_id: str) -> str:
+    """
+    Store a record the API has already encrypted.
+    Messages carry only base64 ciphertext and the hex patient hash, never PHI or the raw
+    patient id; record_id is generated by the API so retries are idempotent.
+    """
+    client = _get_client()
+    _loop.run_until_complete(
+        client.store_sealed_record(
+            record_type,
+            base64.b64decode(encrypted_data),
+            bytes.fromhex(patient_hash),
+            record_id=record_id
+        )
+    )
+    return record_id